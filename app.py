@@ -15,10 +15,18 @@ Run: streamlit run app.py
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime
-from collections import defaultdict
-from itertools import combinations
+from collections import Counter
 import io
+import os
+import stat
+import time
+import hashlib
+import tempfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
 import plotly.express as px
 import plotly.graph_objects as go
 
@@ -90,87 +98,309 @@ st.markdown("""
 # =====================================================
 # ANALYSIS FUNCTIONS
 # =====================================================
-@st.cache_data
-def load_rule_book(file):
-    """Load and process rule book"""
-    df = pd.read_excel(file)
+RULE_BOOK_COLUMNS = ['TCODE1', 'TCODE2', 'ASK_RISK']
+USER_ACCESS_COLUMNS = ['USER NAME', 'ROLE', 'AUTHORIZATION VALUE']
+RISK_LEVELS = ['High', 'Medium', 'Low']
+# Columns shorter than this are counted with collections.Counter instead of value_counts
+COUNTER_MAX_ROWS = 1000
+PARQUET_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'sod_cache')
+# Bump whenever process_rule_book/process_user_access output changes, so old files are ignored
+PARQUET_CACHE_VERSION = 1
+PARQUET_CACHE_MAX_AGE = 7 * 24 * 3600
+PARQUET_CACHE_MAX_BYTES = 1024 ** 3
+
+def hash_dataframe(df):
+    """Hash every row of a DataFrame (Streamlit's default hasher samples large frames)"""
+    return tuple(df.columns), pd.util.hash_pandas_object(df).to_numpy().tobytes()
+
+def read_excel_columns(file_bytes, columns):
+    """Read only the required columns as strings, matching headers case/space-insensitively"""
+    df = pd.read_excel(
+        io.BytesIO(file_bytes),
+        engine='calamine',
+        usecols=lambda col: str(col).strip().upper() in columns,
+        dtype='string[pyarrow]'
+    )
     df.columns = df.columns.str.strip().str.upper()
+    
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
     return df
 
+def parquet_cache_dir():
+    """Return the private Parquet cache directory, or None if it is not safe to use"""
+    try:
+        os.makedirs(PARQUET_CACHE_DIR, mode=0o700, exist_ok=True)
+        info = os.lstat(PARQUET_CACHE_DIR)
+    except OSError:
+        return None
+    # The directory sits in the shared temp dir: refuse one that another user created or can read
+    if not stat.S_ISDIR(info.st_mode) or info.st_mode & 0o077:
+        return None
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+        return None
+    return PARQUET_CACHE_DIR
+
+def evict_parquet_cache(cache_dir):
+    """Drop cache files past PARQUET_CACHE_MAX_AGE, then the oldest until under PARQUET_CACHE_MAX_BYTES"""
+    now = time.time()
+    entries = []
+    for entry in os.scandir(cache_dir):
+        try:
+            info = entry.stat()
+            if now - info.st_mtime > PARQUET_CACHE_MAX_AGE:
+                os.remove(entry.path)
+            else:
+                entries.append((info.st_mtime, info.st_size, entry.path))
+        except OSError:
+            pass
+    
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= PARQUET_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def load_parquet_cached(name, file_bytes, build):
+    """Return build(file_bytes), persisted on disk as Parquet keyed by the file's SHA-256"""
+    cache_dir = parquet_cache_dir()
+    if cache_dir is None:
+        return build(file_bytes)
+    
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    path = os.path.join(cache_dir, f"{name}_v{PARQUET_CACHE_VERSION}_{digest}.parquet")
+    if os.path.exists(path):
+        try:
+            table = pq.read_table(path, memory_map=True)
+            os.utime(path)
+            return table.to_pandas(
+                types_mapper=lambda t: pd.StringDtype('pyarrow') if pa.types.is_large_string(t) or pa.types.is_string(t) else None
+            )
+        except (OSError, ValueError, pa.ArrowException):
+            # Truncated or incompatible file: discard it and rebuild below
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    df = build(file_bytes)
+    # Best effort: write under a temporary name and rename, so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, path)
+        evict_parquet_cache(cache_dir)
+    except (OSError, ValueError, pa.ArrowException):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return df
+
+@st.cache_data(max_entries=8)
+def load_rule_book(file_bytes):
+    """Load and process rule book"""
+    return load_parquet_cached(
+        'rule_book', file_bytes, lambda data: process_rule_book(read_excel_columns(data, RULE_BOOK_COLUMNS))
+    )
+
+@st.cache_data(max_entries=8)
+def load_user_access(file_bytes):
+    """Load and process user access data"""
+    return load_parquet_cached(
+        'user_access', file_bytes, lambda data: process_user_access(read_excel_columns(data, USER_ACCESS_COLUMNS))
+    )
+
+def clean_text(col):
+    """Strip a column into Arrow-backed strings, with blanks for missing cells"""
+    return col.astype('string[pyarrow]').fillna('').str.strip()
+
 def process_rule_book(rule_df):
     """Build conflict pairs with risk factors"""
-    conflict_risk_map = {}
+    t1 = clean_text(rule_df['TCODE1']).str.upper()
+    t2 = clean_text(rule_df['TCODE2']).str.upper()
+    risk = clean_text(rule_df['ASK_RISK'])
     
-    for _, row in rule_df.iterrows():
-        t1 = str(row['TCODE1']).strip().upper()
-        t2 = str(row['TCODE2']).strip().upper()
-        risk = str(row['ASK_RISK']).strip()
-        
-        if t1 and t2 and t1 != 'NAN' and t2 != 'NAN' and t1 != t2:
-            pair = tuple(sorted((t1, t2)))
-            if pair not in conflict_risk_map:
-                conflict_risk_map[pair] = risk
+    valid = (t1 != '') & (t2 != '') & (t1 != 'NAN') & (t2 != 'NAN') & (t1 != t2)
+    t1, t2, risk = t1[valid], t2[valid], risk[valid]
     
-    return conflict_risk_map
+    # Order each pair so (A, B) and (B, A) map to the same conflict
+    rules = pd.DataFrame({
+        'TCODE_1': t1.where(t1 < t2, t2),
+        'TCODE_2': t2.where(t1 < t2, t1),
+        'RISK_FACTOR': risk
+    })
+    # First occurrence of a pair wins
+    return rules.drop_duplicates(subset=['TCODE_1', 'TCODE_2'], keep='first').reset_index(drop=True)
 
 def process_user_access(user_df):
-    """Build user and role mappings"""
-    user_df.columns = user_df.columns.str.strip().str.upper()
+    """Build cleaned user-role-tcode mappings"""
+    access = pd.DataFrame({
+        'USER_NAME': clean_text(user_df['USER NAME']),
+        'ROLE': clean_text(user_df['ROLE']),
+        'TCODE': clean_text(user_df['AUTHORIZATION VALUE']).str.upper()
+    })
+    # Rows without a user still count toward their role; only user-level analysis skips them
+    access = access[
+        (access['ROLE'] != '') & (access['TCODE'] != '') & (access['TCODE'] != 'NAN')
+    ]
     
-    user_role_tcodes = defaultdict(lambda: defaultdict(set))
-    role_to_tcodes = defaultdict(set)
+    return access.drop_duplicates(ignore_index=True)
+
+def find_conflicts(group_ids, tcode_ids, rules):
+    """Join (group, tcode) codes against the rule book, keeping pairs held within the same group"""
+    access = pd.DataFrame({'GROUP': group_ids, 'TCODE': tcode_ids})
+    # Rows whose tcode opens a conflict pair, carrying the tcode it conflicts with
+    candidates = access.merge(rules, left_on='TCODE', right_on='TCODE_1')
     
-    for _, row in user_df.iterrows():
-        user = str(row['USER NAME']).strip()
-        role = str(row['ROLE']).strip()
-        tcode = str(row['AUTHORIZATION VALUE']).strip().upper()
-        
-        if user and role and tcode and tcode != 'NAN':
-            user_role_tcodes[user][role].add(tcode)
-            role_to_tcodes[role].add(tcode)
+    # Keep only candidates whose conflicting tcode is held by the same group,
+    # comparing packed (group << 32 | tcode) int64 keys
+    held = (access['GROUP'].to_numpy(np.int64) << 32) | access['TCODE'].to_numpy(np.int64)
+    wanted = (candidates['GROUP'].to_numpy(np.int64) << 32) | candidates['TCODE_2'].to_numpy(np.int64)
+    violations = candidates.loc[pd.Index(wanted).isin(held), ['GROUP', 'TCODE_1', 'TCODE_2', 'RISK_FACTOR']]
     
-    return user_role_tcodes, role_to_tcodes
+    return violations.sort_values(['GROUP', 'TCODE_1', 'TCODE_2'], ignore_index=True)
 
-def analyze_violations(user_role_tcodes, role_to_tcodes, conflict_risk_map):
+def analyze_violations(access, rules):
     """Detect user-level and role-level violations"""
+    # Encode every string column as integer codes once; sorted factorization keeps
+    # code order equal to string order, so TCODE_1 < TCODE_2 still holds on codes
+    n_rules = len(rules)
+    codes, tcodes = pd.factorize(pd.concat([rules['TCODE_1'], rules['TCODE_2']], ignore_index=True), sort=True)
+    # Known risk levels first (High, Medium, Low), then any others the rule book uses
+    risk_dtype = pd.CategoricalDtype(
+        RISK_LEVELS + sorted(set(rules['RISK_FACTOR']) - set(RISK_LEVELS))
+    )
+    rule_codes = pd.DataFrame({
+        'TCODE_1': codes[:n_rules].astype(np.int32),
+        'TCODE_2': codes[n_rules:].astype(np.int32),
+        'RISK_FACTOR': rules['RISK_FACTOR'].astype(risk_dtype).cat.codes.to_numpy()
+    })
     
-    # User-level violations
-    user_violations = []
-    for user, roles_dict in user_role_tcodes.items():
-        for role, tcodes in roles_dict.items():
-            for t1, t2 in combinations(tcodes, 2):
-                pair = tuple(sorted((t1, t2)))
-                if pair in conflict_risk_map:
-                    user_violations.append({
-                        'USER_NAME': user,
-                        'ROLE': role,
-                        'TCODE_1': pair[0],
-                        'TCODE_2': pair[1],
-                        'RISK_FACTOR': conflict_risk_map[pair]
-                    })
+    # Tcodes that never appear in the rule book cannot conflict
+    tcode_ids = tcodes.get_indexer(access['TCODE'])
+    access = access[tcode_ids >= 0]
+    tcode_ids = tcode_ids[tcode_ids >= 0].astype(np.int32)
+    role_ids, roles = pd.factorize(access['ROLE'], sort=True)
     
-    # Role-level violations
-    role_violations = []
-    for role, tcodes in role_to_tcodes.items():
-        for t1, t2 in combinations(tcodes, 2):
-            pair = tuple(sorted((t1, t2)))
-            if pair in conflict_risk_map:
-                role_violations.append({
-                    'ROLE': role,
-                    'TCODE_1': pair[0],
-                    'TCODE_2': pair[1],
-                    'RISK_FACTOR': conflict_risk_map[pair]
-                })
+    # Role-level violations, one row per distinct (role, tcode)
+    role_tcodes = pd.unique((role_ids.astype(np.int64) << 32) | tcode_ids)
+    role_hits = find_conflicts(role_tcodes >> 32, role_tcodes & 0xFFFFFFFF, rule_codes)
+    role_violations = pd.DataFrame({
+        'ROLE': roles.take(role_hits['GROUP']),
+        'TCODE_1': tcodes.take(role_hits['TCODE_1']),
+        'TCODE_2': tcodes.take(role_hits['TCODE_2']),
+        'RISK_FACTOR': pd.Categorical.from_codes(role_hits['RISK_FACTOR'], dtype=risk_dtype)
+    })
+    
+    # Users only hold tcodes of their roles, so no role conflicts means no user conflicts
+    if role_violations.empty:
+        user_violations = role_violations.assign(USER_NAME=access['USER_NAME'][:0])
+        return user_violations[['USER_NAME', 'ROLE', 'TCODE_1', 'TCODE_2', 'RISK_FACTOR']], role_violations
+    
+    # User-level violations, grouped by (user, role), over rows that name a user
+    has_user = (access['USER_NAME'] != '').to_numpy()
+    user_ids, users = pd.factorize(access['USER_NAME'][has_user], sort=True)
+    role_ids, tcode_ids = role_ids[has_user], tcode_ids[has_user]
+    pair_ids, pairs = pd.factorize(user_ids.astype(np.int64) * len(roles) + role_ids, sort=True)
+    pair_roles = pairs % len(roles)
+    
+    # Most users hold every tcode of a role, and then have exactly that role's
+    # violations: reuse the role-level hits for them and join only the partial holders
+    role_sizes = np.bincount(role_tcodes >> 32, minlength=len(roles))
+    full = np.bincount(pair_ids, minlength=len(pairs)) == role_sizes[pair_roles]
+    full_hits = pd.DataFrame({'GROUP': np.flatnonzero(full), 'ROLE': pair_roles[full]}).merge(
+        role_hits.rename(columns={'GROUP': 'ROLE'}), on='ROLE'
+    ).drop(columns='ROLE')
+    partial = ~full[pair_ids]
+    partial_hits = find_conflicts(pair_ids[partial], tcode_ids[partial], rule_codes)
+    hits = pd.concat([full_hits, partial_hits]).sort_values(['GROUP', 'TCODE_1', 'TCODE_2'], ignore_index=True)
+    
+    pair = pairs[hits['GROUP'].to_numpy()]
+    user_violations = pd.DataFrame({
+        'USER_NAME': users.take(pair // len(roles)),
+        'ROLE': roles.take(pair % len(roles)),
+        'TCODE_1': tcodes.take(hits['TCODE_1']),
+        'TCODE_2': tcodes.take(hits['TCODE_2']),
+        'RISK_FACTOR': pd.Categorical.from_codes(hits['RISK_FACTOR'], dtype=risk_dtype)
+    })
     
     return user_violations, role_violations
 
-def create_excel_download(df, filename):
+@st.cache_data(max_entries=4)
+def run_analysis(rule_book_bytes, user_access_bytes):
+    """Run the full analysis, cached on the uploaded file contents"""
+    return analyze_violations(load_user_access(user_access_bytes), load_rule_book(rule_book_bytes))
+
+def count_risk_levels(df):
+    """Count violations per risk level, in RISK_LEVELS order (for the metric tiles)"""
+    return df['RISK_FACTOR'].value_counts(sort=False).reindex(RISK_LEVELS, fill_value=0).to_numpy()
+
+def top_counts(values, n=10):
+    """Most frequent values as hashable ((value, count), ...) pairs, ties broken by value"""
+    # Counter skips value_counts' setup cost, which dominates on short columns;
+    # both paths rank by count descending, then value ascending
+    if len(values) < COUNTER_MAX_ROWS:
+        counts = Counter(values.to_numpy())
+        return tuple(sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:n])
+    counts = values.value_counts(sort=False).sort_index().sort_values(ascending=False, kind='stable')
+    return tuple((value, int(count)) for value, count in counts.head(n).items())
+
+def risk_level_counts(df):
+    """Violations per RISK_FACTOR category, including labels outside RISK_LEVELS, as hashable pairs"""
+    return tuple((level, int(count)) for level, count in df['RISK_FACTOR'].value_counts(sort=False).items())
+
+@st.cache_resource(max_entries=16)
+def risk_pie_chart(risk_counts, title):
+    """Build risk-level pie chart from ((level, count), ...) pairs, cached on the counts"""
+    # Skip empty levels so the legend only lists risk levels that occur
+    counts = [(level, count) for level, count in risk_counts if count]
+    return px.pie(
+        pd.DataFrame(counts, columns=['Risk Level', 'Count']),
+        values='Count',
+        names='Risk Level',
+        title=title,
+        color='Risk Level',
+        color_discrete_map={'High': '#ff4444', 'Medium': '#ffaa00', 'Low': '#44ff44'}
+    )
+
+@st.cache_resource(max_entries=16)
+def top_violations_chart(counts, label, title, color_scale):
+    """Build horizontal bar chart of the most-violating users or roles"""
+    return px.bar(
+        pd.DataFrame(counts, columns=[label, 'Violations']),
+        x='Violations',
+        y=label,
+        orientation='h',
+        title=title,
+        color='Violations',
+        color_continuous_scale=color_scale
+    )
+
+@st.cache_data(hash_funcs={pd.DataFrame: hash_dataframe}, max_entries=4, ttl=3600)
+def create_excel_download(df):
     """Create Excel file for download"""
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Violations')
-    output.seek(0)
-    return output
+    # constant_memory flushes each row as soon as the next one starts, so rows are
+    # written in order here (pandas' to_excel writes column by column and would lose cells)
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('Violations')
+    worksheet.write_row(0, 0, df.columns, workbook.add_format({'bold': True}))
+    for row, values in enumerate(df.itertuples(index=False), start=1):
+        worksheet.write_row(row, 0, values)
+    workbook.close()
+    return output.getvalue()
+
+@st.cache_data(hash_funcs={pd.DataFrame: hash_dataframe}, max_entries=4, ttl=3600)
+def create_csv_download(df):
+    """Create CSV file for download"""
+    return df.to_csv(index=False).encode('utf-8')
 
 # =====================================================
 # MAIN APPLICATION
@@ -247,46 +477,35 @@ def main():
         status_text = st.empty()
         
         try:
+            rule_book_bytes = rule_book_file.getvalue()
+            user_access_bytes = user_access_file.getvalue()
+            
             # Step 1: Load rule book
             status_text.text("📖 Loading rule book...")
             progress_bar.progress(10)
-            rule_df = load_rule_book(rule_book_file)
-            
-            # Step 2: Process rule book
-            status_text.text("🔧 Processing conflict pairs...")
-            progress_bar.progress(25)
-            conflict_risk_map = process_rule_book(rule_df)
+            rules = load_rule_book(rule_book_bytes)
             
-            # Step 3: Load user access
+            # Step 2: Load user access
             status_text.text("👥 Loading user access data...")
             progress_bar.progress(40)
-            user_df = pd.read_excel(user_access_file)
+            access = load_user_access(user_access_bytes)
             
-            # Step 4: Process user access
-            status_text.text("🗺️ Mapping users and roles...")
-            progress_bar.progress(55)
-            user_role_tcodes, role_to_tcodes = process_user_access(user_df)
-            
-            # Step 5: Analyze violations
+            # Step 3: Analyze violations
             status_text.text("🔍 Analyzing SoD violations...")
             progress_bar.progress(75)
-            user_violations, role_violations = analyze_violations(
-                user_role_tcodes, role_to_tcodes, conflict_risk_map
-            )
+            user_violations_df, role_violations_df = run_analysis(rule_book_bytes, user_access_bytes)
             
-            # Step 6: Complete
+            # Step 4: Complete
             status_text.text("✅ Analysis complete!")
             progress_bar.progress(100)
             
             # Store results in session state
             st.session_state['analyzed'] = True
-            st.session_state['conflict_pairs'] = len(conflict_risk_map)
-            st.session_state['total_users'] = len(user_role_tcodes)
-            st.session_state['total_roles'] = len(role_to_tcodes)
-            st.session_state['user_violations'] = user_violations
-            st.session_state['role_violations'] = role_violations
-            st.session_state['user_violations_df'] = pd.DataFrame(user_violations) if user_violations else pd.DataFrame()
-            st.session_state['role_violations_df'] = pd.DataFrame(role_violations) if role_violations else pd.DataFrame()
+            st.session_state['conflict_pairs'] = len(rules)
+            st.session_state['total_users'] = access.loc[access['USER_NAME'] != '', 'USER_NAME'].nunique()
+            st.session_state['total_roles'] = access['ROLE'].nunique()
+            st.session_state['user_violations_df'] = user_violations_df
+            st.session_state['role_violations_df'] = role_violations_df
             
             st.balloons()
             
@@ -324,7 +543,7 @@ def main():
         with col4:
             st.metric(
                 label="Total Violations",
-                value=f"{len(st.session_state['user_violations']):,}",
+                value=f"{len(st.session_state['user_violations_df']):,}",
                 delta="User-Level"
             )
         
@@ -335,35 +554,45 @@ def main():
         with tab1:
             st.subheader("User-Level SoD Violations")
             
-            if len(st.session_state['user_violations']) > 0:
+            if len(st.session_state['user_violations_df']) > 0:
                 user_df = st.session_state['user_violations_df']
                 
                 # Risk summary
                 col1, col2, col3 = st.columns(3)
-                risk_counts = user_df['RISK_FACTOR'].value_counts()
+                high_count, medium_count, low_count = count_risk_levels(user_df)
                 
                 with col1:
-                    high_count = risk_counts.get('High', 0)
                     st.metric("🔴 High Risk", f"{high_count:,}")
                 
                 with col2:
-                    medium_count = risk_counts.get('Medium', 0)
                     st.metric("🟡 Medium Risk", f"{medium_count:,}")
                 
                 with col3:
-                    low_count = risk_counts.get('Low', 0)
                     st.metric("🟢 Low Risk", f"{low_count:,}")
                 
-                # Download button
+                # Download buttons
                 st.markdown("---")
-                user_excel = create_excel_download(user_df, "user_violations")
-                st.download_button(
-                    label="📥 Download User-Level Report (Excel)",
-                    data=user_excel,
-                    file_name=f"user_level_violations_{datetime.today().strftime('%Y%m%d')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    use_container_width=True
-                )
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    user_excel = create_excel_download(user_df)
+                    st.download_button(
+                        label="📥 Download User-Level Report (Excel)",
+                        data=user_excel,
+                        file_name=f"user_level_violations_{datetime.today().strftime('%Y%m%d')}.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        use_container_width=True
+                    )
+                
+                with col2:
+                    user_csv = create_csv_download(user_df)
+                    st.download_button(
+                        label="📥 Download User-Level Report (CSV)",
+                        data=user_csv,
+                        file_name=f"user_level_violations_{datetime.today().strftime('%Y%m%d')}.csv",
+                        mime="text/csv",
+                        use_container_width=True
+                    )
                 
                 # Display table
                 st.markdown("### Detailed Violations")
@@ -380,35 +609,45 @@ def main():
         with tab2:
             st.subheader("Role-Level SoD Violations")
             
-            if len(st.session_state['role_violations']) > 0:
+            if len(st.session_state['role_violations_df']) > 0:
                 role_df = st.session_state['role_violations_df']
                 
                 # Risk summary
                 col1, col2, col3 = st.columns(3)
-                risk_counts = role_df['RISK_FACTOR'].value_counts()
+                high_count, medium_count, low_count = count_risk_levels(role_df)
                 
                 with col1:
-                    high_count = risk_counts.get('High', 0)
                     st.metric("🔴 High Risk", f"{high_count:,}")
                 
                 with col2:
-                    medium_count = risk_counts.get('Medium', 0)
                     st.metric("🟡 Medium Risk", f"{medium_count:,}")
                 
                 with col3:
-                    low_count = risk_counts.get('Low', 0)
                     st.metric("🟢 Low Risk", f"{low_count:,}")
                 
-                # Download button
+                # Download buttons
                 st.markdown("---")
-                role_excel = create_excel_download(role_df, "role_violations")
-                st.download_button(
-                    label="📥 Download Role-Level Report (Excel)",
-                    data=role_excel,
-                    file_name=f"role_level_violations_{datetime.today().strftime('%Y%m%d')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    use_container_width=True
-                )
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    role_excel = create_excel_download(role_df)
+                    st.download_button(
+                        label="📥 Download Role-Level Report (Excel)",
+                        data=role_excel,
+                        file_name=f"role_level_violations_{datetime.today().strftime('%Y%m%d')}.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        use_container_width=True
+                    )
+                
+                with col2:
+                    role_csv = create_csv_download(role_df)
+                    st.download_button(
+                        label="📥 Download Role-Level Report (CSV)",
+                        data=role_csv,
+                        file_name=f"role_level_violations_{datetime.today().strftime('%Y%m%d')}.csv",
+                        mime="text/csv",
+                        use_container_width=True
+                    )
                 
                 # Display table
                 st.markdown("### Detailed Violations")
@@ -425,74 +664,36 @@ def main():
         with tab3:
             st.subheader("📈 Risk Analysis Visualizations")
             
-            if len(st.session_state['user_violations']) > 0:
+            if len(st.session_state['user_violations_df']) > 0:
                 
                 col1, col2 = st.columns(2)
                 
                 # User violations by risk
                 with col1:
                     user_df = st.session_state['user_violations_df']
-                    risk_counts = user_df['RISK_FACTOR'].value_counts().reset_index()
-                    risk_counts.columns = ['Risk Level', 'Count']
-                    
-                    fig1 = px.pie(
-                        risk_counts,
-                        values='Count',
-                        names='Risk Level',
-                        title='User Violations by Risk Level',
-                        color='Risk Level',
-                        color_discrete_map={'High': '#ff4444', 'Medium': '#ffaa00', 'Low': '#44ff44'}
-                    )
+                    risk_counts = risk_level_counts(user_df)
+                    fig1 = risk_pie_chart(risk_counts, 'User Violations by Risk Level')
                     st.plotly_chart(fig1, use_container_width=True)
                 
                 # Role violations by risk
                 with col2:
                     role_df = st.session_state['role_violations_df']
-                    risk_counts = role_df['RISK_FACTOR'].value_counts().reset_index()
-                    risk_counts.columns = ['Risk Level', 'Count']
-                    
-                    fig2 = px.pie(
-                        risk_counts,
-                        values='Count',
-                        names='Risk Level',
-                        title='Role Violations by Risk Level',
-                        color='Risk Level',
-                        color_discrete_map={'High': '#ff4444', 'Medium': '#ffaa00', 'Low': '#44ff44'}
-                    )
+                    risk_counts = risk_level_counts(role_df)
+                    fig2 = risk_pie_chart(risk_counts, 'Role Violations by Risk Level')
                     st.plotly_chart(fig2, use_container_width=True)
                 
                 # Top 10 high-risk users
                 st.markdown("### 🔥 Top 10 High-Risk Users")
                 user_df = st.session_state['user_violations_df']
-                top_users = user_df['USER_NAME'].value_counts().head(10).reset_index()
-                top_users.columns = ['User', 'Violations']
-                
-                fig3 = px.bar(
-                    top_users,
-                    x='Violations',
-                    y='User',
-                    orientation='h',
-                    title='Users with Most Violations',
-                    color='Violations',
-                    color_continuous_scale='Reds'
-                )
+                top_users = top_counts(user_df['USER_NAME'])
+                fig3 = top_violations_chart(top_users, 'User', 'Users with Most Violations', 'Reds')
                 st.plotly_chart(fig3, use_container_width=True)
                 
                 # Top 10 high-risk roles
                 st.markdown("### 🎭 Top 10 High-Risk Roles")
                 role_df = st.session_state['role_violations_df']
-                top_roles = role_df['ROLE'].value_counts().head(10).reset_index()
-                top_roles.columns = ['Role', 'Violations']
-                
-                fig4 = px.bar(
-                    top_roles,
-                    x='Violations',
-                    y='Role',
-                    orientation='h',
-                    title='Roles with Most Violations',
-                    color='Violations',
-                    color_continuous_scale='Oranges'
-                )
+                top_roles = top_counts(role_df['ROLE'])
+                fig4 = top_violations_chart(top_roles, 'Role', 'Roles with Most Violations', 'Oranges')
                 st.plotly_chart(fig4, use_container_width=True)
 
 # =====================================================